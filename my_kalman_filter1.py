@@ -1,9 +1,201 @@
+from functools import lru_cache
+
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.linalg import inv, norm
+from scipy.linalg import norm, solve_triangular
+
+
+def _estimate_nd(F, FT, Q, H, HT, R, u, x0, P0, z, out_x, out_P,
+                 h_is_selector=False, sequential=False):
+    """
+    Run the multivariate Kalman filter over the observations z, writing the
+    i-th state estimate to out_x[i] and its error covariance to out_P[i].
+    All arrays must be contiguous and share one float dtype. If h_is_selector,
+    H is assumed to pick out the first m state components and is applied by
+    slicing. If sequential, R must be diagonal and the observation components
+    are folded in one at a time as scalar updates.
+    """
+    m = H.shape[0]
+    I = np.zeros_like(F)
+    for j in range(F.shape[0]):
+        I[j,j] = 1
+    x = x0.copy()
+    P = P0.copy()
+    for i in range(z.shape[0]):
+        #Predict step
+        new_x = F@x + u
+        new_P = F@P@FT + Q
+        
+        #Update step
+        if sequential:
+            x = new_x
+            P = new_P
+            for j in range(m):
+                if h_is_selector:
+                    hP = P[j].copy()
+                    s_j = hP[j] + R[j,j]
+                    y_j = z[i,j] - x[j]
+                else:
+                    hP = H[j]@P
+                    s_j = hP@H[j] + R[j,j]
+                    y_j = z[i,j] - H[j]@x
+                K_j = hP/s_j
+                x = x + K_j*y_j
+                
+                #Scalar Joseph form, (I - K_j h_j) P (I - K_j h_j)^T + r_j K_j K_j^T
+                if h_is_selector:
+                    IKh = I.copy()
+                    IKh[:,j] -= K_j
+                else:
+                    IKh = I - np.outer(K_j, H[j])
+                P = IKh@P@IKh.T + R[j,j]*np.outer(K_j, K_j)
+        else:
+            if h_is_selector:
+                y_t = z[i] - new_x[:m]
+                HP = new_P[:m].copy()
+                Sk = new_P[:m,:m] + R
+            else:
+                y_t = z[i] - H@new_x
+                HP = H@new_P
+                Sk = HP@HT + R
+            Kk = np.ascontiguousarray(np.linalg.solve(Sk, HP).T)
+            x = new_x + Kk@y_t
+            
+            #Joseph form keeps P symmetric positive definite under rounding
+            if h_is_selector:
+                IKH = I.copy()
+                IKH[:,:m] -= Kk
+            else:
+                IKH = I - Kk@H
+            P = IKH@new_P@IKH.T + Kk@R@Kk.T
+        P += P.T.copy()
+        P *= 0.5
+        
+        out_x[i] = x
+        out_P[i] = P
+
+def _estimate_4x2(F, Q, H, R, u, x0, P0, z, out_x, out_P):
+    """
+    _estimate_nd specialized to n=4 states and m=2 observations. Every
+    product is an explicit loop with a constant trip count, which numba
+    unrolls fully, and Sk is inverted in closed form, so a step makes no
+    BLAS or LAPACK calls and allocates nothing. Accumulators start from a
+    zero of the input dtype so float32 runs stay in float32.
+    """
+    x = x0.copy()
+    P = P0.copy()
+    zero = np.zeros(1, dtype=P.dtype)[0]
+    I = np.zeros_like(P)
+    for a in range(4):
+        I[a,a] = 1
+    new_x = np.empty_like(x)
+    FP = np.empty_like(P)
+    new_P = np.empty_like(P)
+    IKH = np.empty_like(P)
+    IKHP = np.empty_like(P)
+    HP = np.empty((2, 4), dtype=P.dtype)
+    K = np.empty((4, 2), dtype=P.dtype)
+    for i in range(z.shape[0]):
+        #Predict step: new_x = F x + u, new_P = F P F^T + Q
+        for a in range(4):
+            acc = u[a]
+            for b in range(4):
+                acc += F[a,b]*x[b]
+            new_x[a] = acc
+        for a in range(4):
+            for c in range(4):
+                acc = zero
+                for b in range(4):
+                    acc += F[a,b]*P[b,c]
+                FP[a,c] = acc
+        for a in range(4):
+            for d in range(4):
+                acc = Q[a,d]
+                for c in range(4):
+                    acc += FP[a,c]*F[d,c]
+                new_P[a,d] = acc
+        
+        #Update step: Sk = H new_P H^T + R, inverted as a 2x2
+        for r in range(2):
+            for c in range(4):
+                acc = zero
+                for b in range(4):
+                    acc += H[r,b]*new_P[b,c]
+                HP[r,c] = acc
+        s00, s01, s10, s11 = R[0,0], R[0,1], R[1,0], R[1,1]
+        y0, y1 = z[i,0], z[i,1]
+        for c in range(4):
+            s00 += HP[0,c]*H[0,c]
+            s01 += HP[0,c]*H[1,c]
+            s10 += HP[1,c]*H[0,c]
+            s11 += HP[1,c]*H[1,c]
+            y0 -= H[0,c]*new_x[c]
+            y1 -= H[1,c]*new_x[c]
+        det = s00*s11 - s01*s10
+        i00, i01, i10, i11 = s11/det, -s01/det, -s10/det, s00/det
+        
+        #K = new_P H^T Sk^-1 = (H new_P)^T Sk^-1 since new_P is symmetric
+        for a in range(4):
+            K[a,0] = HP[0,a]*i00 + HP[1,a]*i10
+            K[a,1] = HP[0,a]*i01 + HP[1,a]*i11
+            x[a] = new_x[a] + K[a,0]*y0 + K[a,1]*y1
+        
+        #Joseph form: P = (I - K H) new_P (I - K H)^T + K R K^T
+        for a in range(4):
+            for b in range(4):
+                IKH[a,b] = I[a,b] - K[a,0]*H[0,b] - K[a,1]*H[1,b]
+        for a in range(4):
+            for c in range(4):
+                acc = zero
+                for b in range(4):
+                    acc += IKH[a,b]*new_P[b,c]
+                IKHP[a,c] = acc
+        for a in range(4):
+            for d in range(a, 4):
+                acc = (K[a,0]*(R[0,0]*K[d,0] + R[0,1]*K[d,1])
+                       + K[a,1]*(R[1,0]*K[d,0] + R[1,1]*K[d,1]))
+                for c in range(4):
+                    acc += IKHP[a,c]*IKH[d,c]
+                P[a,d] = acc
+                P[d,a] = acc
+        
+        out_x[i] = x
+        out_P[i] = P
+
+def _as_contiguous(a, dtype=np.float64):
+    """Return a as a C-contiguous array of dtype, copying only if needed."""
+    return np.ascontiguousarray(a, dtype=dtype)
+
+def _matrix_powers(A, k):
+    """Return the array of shape (k,n,n) holding A^0, A^1, ..., A^(k-1)."""
+    n = len(A)
+    powers = np.empty((k, n, n), dtype=np.result_type(A, np.float32))
+    powers[0] = np.eye(n)
+    for j in range(1, k):
+        np.matmul(powers[j-1], A, out=powers[j])
+    return powers
+
+_compiled = {}
+
+def _jit(func):
+    """
+    Return func compiled with numba, or None if numba is not installed.
+    numba is imported and func compiled on first request only, so importing
+    this module stays cheap and filters that don't ask for the JIT never pay
+    its start-up or compile time.
+    """
+    if func not in _compiled:
+        try:
+            from numba import njit
+        except ImportError:
+            _compiled[func] = None
+        else:
+            _compiled[func] = njit(cache=True, fastmath=True)(func)
+    return _compiled[func]
+
 
 class KalmanFilter(object):
-    def __init__(self,F,Q,H,R,u,one_d=False):
+    def __init__(self,F,Q,H,R,u,one_d=False,h_is_selector=None,
+                 sequential_update=None,dtype=np.float64,jit=False):
         """
         Initialize the dynamical system models.
         
@@ -19,15 +211,64 @@ class KalmanFilter(object):
             The covariance matric for observation noise.
         u : ndarray of shape (n,)
             The control vector.
+        h_is_selector : bool or None
+            Whether H just selects the first m state components, letting
+            estimate slice the state instead of multiplying by H. Detected
+            from H when None.
+        sequential_update : bool or None
+            Whether estimate folds in the observation components one at a
+            time as scalar updates, which needs no matrix solve but is only
+            valid for diagonal R. Enabled when None and R is diagonal.
+            
+            When both flags are left as None, jit is set and H has shape
+            (2,4), estimate runs a kernel specialized to that shape, which
+            does a plain joint update; both flags are then set to False to
+            say so. Set either flag explicitly to have estimate honor it
+            instead.
+        dtype : numpy float dtype
+            The precision the filter's estimates are computed and stored in.
+            float32 halves the memory traffic and is plenty when the noise
+            dominates. evolve always simulates in float64.
+        jit : bool
+            Run estimate's loop compiled with numba, which is imported on
+            first use. Much faster per call, but the first call compiles for
+            several seconds unless numba's on-disk cache is warm. Ignored,
+            falling back to the Python loop, when numba is not installed.
         """
+        self._auto_update = h_is_selector is None and sequential_update is None
+        if self._auto_update and jit and not one_d and np.shape(H) == (2, 4):
+            h_is_selector = sequential_update = False
+        if h_is_selector is None:
+            h_is_selector = (not one_d and np.ndim(H) == 2
+                             and np.array_equal(H, np.eye(*np.shape(H))))
+        if sequential_update is None:
+            sequential_update = (not one_d and np.ndim(R) == 2
+                                 and np.count_nonzero(R - np.diag(np.diag(R))) == 0)
+        if not one_d:
+            #Contiguous copies, including the transposes, so BLAS never has to
+            #repack a strided view inside the filter loops
+            F, Q, H, R, u = (np.ascontiguousarray(A, dtype=dtype)
+                             for A in (F, Q, H, R, u))
+            FT, HT = np.ascontiguousarray(F.T), np.ascontiguousarray(H.T)
+        else:
+            #Length-1 arrays are accepted for the scalar model; reduce them
+            #to scalars so each step writes a single element
+            F, Q, H, R, u = (np.squeeze(A)[()] for A in (F, Q, H, R, u))
+            FT, HT = F, H
         self.one_d = one_d
+        self.h_is_selector = h_is_selector
+        self.sequential_update = sequential_update
+        self.dtype = dtype
+        self.jit = jit
         self.F = F
+        self.FT = FT
         self.Q = Q
         self.H = H
+        self.HT = HT
         self.R = R
         self.u = u
     
-    def evolve(self,x0,N):
+    def evolve(self,x0,N,seed=None):
         """
         Compute the first N states and observations generated by the Kalman system.
 
@@ -37,42 +278,42 @@ class KalmanFilter(object):
             The initial state.
         N : integer
             The number of time steps to evolve.
+        seed : int or None
+            Seed for the noise generator, for reproducible runs.
 
         Returns
         -------
-        states : ndarray of shape (n,N)
-            The i-th column gives the i-th state.
-        obs : ndarray of shape (m,N)
-            The i-th column gives the i-th observation.
+        states : ndarray of shape (N+1,n)
+            The i-th row gives the i-th state, starting with x0.
+        obs : ndarray of shape (N,m)
+            The i-th row gives the observation of the i-th state.
         """
-        x = [x0]
-        z = []
+        rng = np.random.default_rng(seed)
         
         if not self.one_d:
-        
+            n, m = len(x0), len(self.R)
+            #Draw all of the noise up front so Q and R are only factored once
+            W = rng.multivariate_normal(np.zeros(n), self.Q, size=N)
+            V = rng.multivariate_normal(np.zeros(m), self.R, size=N)
+            
+            x = np.empty((N+1, n))
+            x[0] = x0
             for t in range(N):
-                w = np.random.multivariate_normal(np.array([0,0,0,0]), self.Q)
-                v = np.random.multivariate_normal(np.array([0,0]), self.R)
-                x1 = self.F@x0 + self.u + w
-                z1 = self.H@x0 + v
-                
-                x.append(x1)
-                z.append(z1)
-                
-                x0 = x1
+                x[t+1] = self.F@x[t] + self.u + W[t]
+            z = x[:-1]@self.HT + V
         else:
+            W = rng.normal(0, np.sqrt(self.Q), size=N)
+            V = rng.normal(0, np.sqrt(self.R), size=N)
+            
+            x = np.empty(N+1)
+            x[0] = np.squeeze(x0)
             for t in range(N):
-                w = np.random.normal(0, self.Q)
-                v = np.random.normal(0, self.R)
-                x1 = self.F*x0 + self.u + w
-                z1 = self.H*x0 + v
-                
-                x.append(x1)
-                z.append(z1)
+                x[t+1] = self.F*x[t] + self.u + W[t]
+            z = self.H*x[:-1] + V
                 
-        return x, z     
+        return x, z
 
-    def estimate(self,x0,P0,z, return_norms = False):
+    def estimate(self,x0,P0,z, return_norms = False, square_root = False):
         """
         Compute the state estimates using the kalman filter.
 
@@ -82,40 +323,80 @@ class KalmanFilter(object):
             The initial state estimate.
         P0 : ndarray of shape (n,n)
             The initial error covariance matrix.
-        z : ndarray of shape(m,N)
-            Sequence of N observations (each column is an observation).
+        z : ndarray of shape(N,m)
+            Sequence of N observations (each row is an observation).
+        square_root : bool
+            Propagate a Cholesky factor L of the covariance (P = L L^T) using
+            QR triangularizations instead of updating P itself. Slower, but P
+            stays positive definite however long the run. Requires Q, R and
+            P0 to be positive definite.
 
         Returns
         -------
-        out : ndarray of shape (n,N)
-            Sequence of state estimates (each column is an estimate).
-        norms: list of floats of length N
-            Gives the norm of the error matrix for each estimate.
+        out : ndarray of shape (N,n)
+            Sequence of state estimates (each row is an estimate).
+        P : ndarray of shape (N,n,n)
+            The error covariance matrix for each estimate.
         """
-        N = len(z)
-        out = []
-        P = []
+        if self.one_d and square_root:
+            raise ValueError("square_root requires a multivariate filter")
         
+        N = len(z)
+        dtype = self.dtype
         if not self.one_d:
-            I = np.eye(len(P0))
+            n = len(x0)
+            out = np.empty((N, n), dtype=dtype)
+            P = np.empty((N, n, n), dtype=dtype)
+            x0 = np.asarray(x0, dtype=dtype)
+            P0 = np.asarray(P0, dtype=dtype)
+            z = np.asarray(z, dtype=dtype)
+        else:
+            out = np.empty(N, dtype=dtype)
+            P = np.empty(N, dtype=dtype)
+            x0, P0 = np.squeeze(x0)[()], np.squeeze(P0)[()]
+            z = np.reshape(z, N)
+        
+        if not self.one_d and square_root:
+            F, H, u = self.F, self.H, self.u
+            m, n = H.shape
+            L = np.linalg.cholesky(P0)
+            
+            #Pre-arrays for the predict and update triangularizations
+            pre_pred = np.empty((n, 2*n), dtype=dtype)
+            pre_pred[:,n:] = np.linalg.cholesky(self.Q)
+            pre = np.zeros((m+n, m+n), dtype=dtype)
+            pre[:m,:m] = np.linalg.cholesky(self.R)
             for i in range(N):
-                #Predict step
-                new_x = self.F@x0 + self.u
-                new_P = self.F@P0@self.F.T + self.Q
-                
-                #Update step
-                y_t = z[i] - self.H@new_x
-                Sk = self.H@new_P@self.H.T + self.R
-                Kk = new_P@self.H.T@(inv(Sk))
-                final_x = new_x + Kk@y_t
-                final_P = (I - Kk@self.H)@new_P
-                
-                out.append(final_x)
-                P.append(final_P)
+                #Predict step: [F L, Q^1/2] -> [L_pred, 0]
+                new_x = F@x0 + u
+                np.matmul(F, L, out=pre_pred[:,:n])
+                L_pred = np.linalg.qr(pre_pred.T, mode='r').T
                 
-                x0 = final_x
-                P0 = final_P
+                #Update step: [[R^1/2, H L_pred], [0, L_pred]] -> [[Sk^1/2, 0], [K Sk^1/2, L]]
+                np.matmul(H, L_pred, out=pre[:m,m:])
+                pre[m:,m:] = L_pred
+                post = np.linalg.qr(pre.T, mode='r').T
+                Sk_half, K_bar, L = post[:m,:m], post[m:,:m], post[m:,m:]
+                y_t = z[i] - H@new_x
+                out[i] = new_x + K_bar@solve_triangular(Sk_half, y_t, lower=True,
+                                                        check_finite=False)
+                np.matmul(L, L.T, out=P[i])
                 
+                x0 = out[i]
+            
+        elif (not self.one_d and self.jit and self._auto_update
+              and self.H.shape == (2, 4) and _jit(_estimate_4x2) is not None):
+            args = (_as_contiguous(A, dtype) for A in
+                    (self.F, self.Q, self.H, self.R, self.u, x0, P0, z))
+            _jit(_estimate_4x2)(*args, out, P)
+            
+        elif not self.one_d:
+            estimate_nd = (self.jit and _jit(_estimate_nd)) or _estimate_nd
+            args = (_as_contiguous(A, dtype) for A in
+                    (self.F, self.FT, self.Q, self.H, self.HT, self.R,
+                     self.u, x0, P0, z))
+            estimate_nd(*args, out, P, self.h_is_selector, self.sequential_update)
+            
         else:
             for i in range(N):
                 new_x = self.F*x0 + self.u
@@ -124,16 +405,89 @@ class KalmanFilter(object):
                 y_t = z[i] - self.H*new_x
                 Sk = (self.H**2)*new_P + self.R
                 Kk = new_P*self.H*(1/Sk)
-                final_x = new_x + Kk*y_t
-                final_P = (1 - Kk*self.H)*new_P
+                out[i] = new_x + Kk*y_t
+                P[i] = (1 - Kk*self.H)*new_P
                 
-                out.append(final_x)
-                P.append(final_P)
-                
-                x0 = final_x
-                P0 = final_P
+                x0 = out[i]
+                P0 = P[i]
                 
         return out, P
+    
+    def estimate_batch(self,X0,P0,Z):
+        """
+        Run S independent Kalman filters with the same models at once, one
+        per observation sequence. Every matrix operation is batched over the
+        leading axis, so each step is a handful of stacked NumPy/LAPACK calls
+        regardless of S.
+
+        Parameters
+        ----------
+        X0 : ndarray of shape (S,n)
+            The initial state estimate for each filter.
+        P0 : ndarray of shape (n,n) or (S,n,n)
+            The initial error covariance matrix, shared or per filter.
+        Z : ndarray of shape (S,N,m)
+            The sequence of N observations for each filter.
+
+        Returns
+        -------
+        out : ndarray of shape (S,N,n)
+            Sequence of state estimates for each filter.
+        P : ndarray of shape (S,N,n,n)
+            The error covariance matrix for each estimate.
+        """
+        if self.one_d:
+            raise ValueError("estimate_batch requires a multivariate filter")
+        
+        F, H, Q, R, u = self.F, self.H, self.Q, self.R, self.u
+        FT, HT = self.FT, self.HT
+        Z = np.asarray(Z, dtype=self.dtype)
+        S, N, m = Z.shape
+        n = len(F)
+        I = np.eye(n, dtype=self.dtype)
+        
+        x = np.asarray(X0, dtype=self.dtype)
+        P_prev = np.broadcast_to(np.asarray(P0, dtype=self.dtype), (S, n, n))
+        out = np.empty((S, N, n), dtype=self.dtype)
+        P = np.empty((S, N, n, n), dtype=self.dtype)
+        
+        #Every intermediate of the step is written into one of these buffers
+        tmp_nn = np.empty((S, n, n), dtype=self.dtype)
+        new_P = np.empty((S, n, n), dtype=self.dtype)
+        HP = np.empty((S, m, n), dtype=self.dtype)
+        Sk = np.empty((S, m, m), dtype=self.dtype)
+        for i in range(N):
+            #Predict step
+            new_x = x@FT
+            new_x += u
+            np.matmul(F, P_prev, out=tmp_nn)
+            np.matmul(tmp_nn, FT, out=new_P)
+            new_P += Q
+            
+            #Update step
+            if self.h_is_selector:
+                y_t = Z[:,i] - new_x[:,:m]
+                HP[:] = new_P[:,:m]
+                np.add(new_P[:,:m,:m], R, out=Sk)
+            else:
+                y_t = Z[:,i] - new_x@HT
+                np.matmul(H, new_P, out=HP)
+                np.matmul(HP, HT, out=Sk)
+                Sk += R
+            Kk = np.linalg.solve(Sk, HP).transpose(0,2,1)
+            x = out[:,i]
+            np.add(new_x, (Kk@y_t[...,None])[...,0], out=x)
+            
+            #Joseph form, accumulated straight into the output slot
+            IKH = I - Kk@H
+            P_prev = P[:,i]
+            np.matmul(IKH, new_P, out=tmp_nn)
+            np.matmul(tmp_nn, IKH.transpose(0,2,1), out=P_prev)
+            P_prev += Kk@R@Kk.transpose(0,2,1)
+            P_prev += P_prev.transpose(0,2,1)
+            P_prev *= 0.5
+        
+        return out, P
             
             
             
@@ -151,23 +505,21 @@ class KalmanFilter(object):
 
         Returns
         -------
-        out : ndarray of shape (n,k)
-            The next k predicted states.
+        out : ndarray of shape (k,n)
+            The next k predicted states, starting with x.
         """
-        new_x = [x]
-        
+        #Since F and u are constant, x_j = F^j x + (I + F + ... + F^(j-1)) u
         if not self.one_d:
-            for i in range(k-1):
-                new_x.append(self.F@new_x[-1] + self.u)
-        
-            
-            return np.array(new_x).reshape((k,len(x)))
+            F_powers = _matrix_powers(self.F, k)
+            new_x = np.einsum('jab,b->ja', F_powers, x)
+            new_x[1:] += np.cumsum(F_powers[:-1], axis=0)@self.u
         
         else:
-            for i in range(k-1):
-                new_x.append(self.F*new_x[-1] + self.u)
+            F_powers = float(self.F)**np.arange(k)
+            new_x = F_powers*x
+            new_x[1:] += np.cumsum(F_powers[:-1])*self.u
                 
-            return new_x
+        return new_x
     
     def rewind(self,x,k):
         """
@@ -182,21 +534,61 @@ class KalmanFilter(object):
     
         Returns
         -------
-        out : ndarray of shape (n,k)
-            The predicted states from time 0 up through k-1 (in that order).
+        out : ndarray of shape (k,n)
+            The predicted states, starting with x and stepping back in time.
         """
-        new_x = [x]
-        
         if not self.one_d:
-            for i in range(k-1):
-                new_x.append(inv(self.F)@(new_x[-1] - self.u))
-    
-            return np.array(new_x).reshape((k, len(x)))
+            new_x = self._rewind_chains([x], [k])[0]
         
         else:
-            for i in range(k-1):
-                new_x.append((1/self.F)*(new_x[-1] - self.u))
-            return new_x
+            G_powers = (1/float(self.F))**np.arange(k)
+            new_x = G_powers*x
+            new_x[1:] -= np.cumsum(G_powers[1:])*self.u
+                
+        return new_x
+    
+    def rewind_batch(self,X,k):
+        """
+        Rewind several independent state estimates at once. F is inverted
+        and its powers formed only once, for the longest chain.
+    
+        Parameters
+        ----------
+        X : ndarray of shape (S,n)
+            The state estimates to rewind, one per row.
+        k : integer or sequence of S integers
+            The number of states to produce, shared or per chain.
+    
+        Returns
+        -------
+        out : list of S ndarrays of shape (k_s,n)
+            For each row of X, the states as returned by rewind.
+        """
+        if self.one_d:
+            raise ValueError("rewind_batch requires a multivariate filter")
+        
+        X = np.asarray(X, dtype=self.dtype)
+        ks = [k]*len(X) if np.ndim(k) == 0 else k
+        return self._rewind_chains(X, ks)
+    
+    def _rewind_chains(self,X,ks):
+        """Rewind the s-th row of X for ks[s] steps; see rewind."""
+        #With G = F^-1 constant, x_j = G^j x - (G + G^2 + ... + G^j) u
+        G_powers = _matrix_powers(np.linalg.inv(self.F), max(ks))
+        drift = np.cumsum(G_powers[1:], axis=0)@self.u
+        chains = []
+        for x, k in zip(X, ks):
+            new_x = np.einsum('jab,b->ja', G_powers[:k], x)
+            new_x[1:] -= drift[:k-1]
+            chains.append(new_x)
+        return chains
+
+def _components(states):
+    """
+    Split an array of row states of shape (N,k) into k contiguous arrays of
+    length N, one per state component (e.g. px, py, vx, vy).
+    """
+    return np.ascontiguousarray(np.asarray(states).T)
 
 def problem2():
     """ 
@@ -213,7 +605,7 @@ def problem2():
     F = np.array([[1,0,.1,0], [0,1,0,.1], [0,0,1,0], [0,0,0,1]])
     H = np.array([[1,0,0,0], [0,1,0,0]])
     u = np.array([0,0,0,-0.98])
-    new_filter = KalmanFilter(F, Q, H, R, u) 
+    new_filter = KalmanFilter(F, Q, H, R, u)
     
     #x, z = new_filter.evolve(np.array([0,0,300,600]), 1250)
     return new_filter
@@ -228,41 +620,66 @@ plt.plot(new_z[:,0], new_z[:,1], color="red")
 plt.tight_layout()
 plt.show()"""
 
-def problem5(plot=True):
+def _compute_problem5(seed):
     """
-    Calculate an initial state estimate xb200. Using the initial state estimate, 
-    P200 and your Kalman Filter, compute the next 600 state estimates. 
-    Plot these state estimates as a smooth green
-    curve together with the radar observations (as red dots) and the entire
-    true state sequence (as blue curve).
+    Simulate the projectile and run the Kalman Filter for problem5.
     """
     KF = problem2()
-    x, z = KF.evolve(np.array([0,0,300,600]), 1250)
-    new_z = np.array(z).reshape((1250,2))
-    new_x = np.array(x).reshape((1251,4))
+    new_x, new_z = KF.evolve(np.array([0,0,300,600]), 1250, seed=seed)
     z_slice = new_z[200:800]
+    zx, zy = _components(z_slice)
     
-    z_initial = z_slice[0:9]
-    z_diff = np.diff(z_initial, axis=0)/.1
-    avg = np.mean(z_diff, axis=0)
+    #Initial velocity is the average finite difference over the first 9 observations
+    avg_vx = (zx[1:9] - zx[:8]).mean()/.1
+    avg_vy = (zy[1:9] - zy[:8]).mean()/.1
     
-    x0 = np.array([z_slice[0][0], z_slice[0][1], avg[0], avg[1]])
+    x0 = np.array([zx[0], zy[0], avg_vx, avg_vy])
     P0 = 10**6 * KF.Q
     x_final, P_final = KF.estimate(x0, P0, z_slice)
+    return x_final, P_final, new_x, z_slice, KF
+
+@lru_cache(maxsize=2)
+def _cached_problem5(seed):
+    """
+    _compute_problem5 cached per seed, so the drivers building on problem5
+    share one run. The arrays are made read-only since every caller gets the
+    same objects.
+    """
+    result = _compute_problem5(seed)
+    for a in result[:4]:
+        a.flags.writeable = False
+    return result
+
+def problem5(plot=True, seed=0):
+    """
+    Calculate an initial state estimate xb200. Using the initial state estimate, 
+    P200 and your Kalman Filter, compute the next 600 state estimates. 
+    Plot these state estimates as a smooth green
+    curve together with the radar observations (as red dots) and the entire
+    true state sequence (as blue curve).
+    
+    The run for a given seed is cached and its arrays are read-only; with
+    seed=None a fresh random run is made every call.
+    """
+    if seed is None:
+        x_final, P_final, new_x, z_slice, KF = _compute_problem5(seed)
+    else:
+        x_final, P_final, new_x, z_slice, KF = _cached_problem5(seed)
     
     if plot:
-        x0 = np.array(x).reshape((1251,4))
-        x_final = np.array(x_final).reshape((600,4))
-        z_ = np.array(z_slice).reshape((600,2))
+        import matplotlib.pyplot as plt
+        px, py = _components(new_x[:,:2])
+        zx, zy = _components(z_slice)
+        ex, ey = _components(x_final[:,:2])
         plt.subplot(121)
-        plt.plot(x0[:,0], x0[:,1], color="blue", lw=.5)
-        plt.scatter(z_[:,0], z_[:,1], color="red", s=.5)
-        plt.plot(x_final[:,0], x_final[:,1], color="green")
+        plt.plot(px, py, color="blue", lw=.5)
+        plt.scatter(zx, zy, color="red", s=.5)
+        plt.plot(ex, ey, color="green")
         plt.title("Big Picture")
         plt.subplot(122)
-        plt.plot(x0[:,0], x0[:,1], color="blue", lw=.5)
-        plt.scatter(z_[:,0], z_[:,1], color="red", s=.5)
-        plt.plot(x_final[:,0], x_final[:,1], color="green")
+        plt.plot(px, py, color="blue", lw=.5)
+        plt.scatter(zx, zy, color="red", s=.5)
+        plt.plot(ex, ey, color="green")
         plt.title("Zoomed In")
         plt.xlim(7400,9200)
         plt.ylim(11800, 13600)
@@ -273,7 +690,7 @@ def problem5(plot=True):
 #problem5()
 
 
-def problem7():
+def problem7(seed=0):
     """
     Using the final state estimate xb800 that you obtained in Problem 5, 
     predict the future states of the projectile until it hits the ground. 
@@ -281,16 +698,19 @@ def problem7():
     (as a yellow curve), and observe how near the prediction is to the actual 
     point of impact. Y
     """    
-    xf, pf, x0, zs, KF = problem5(False) 
+    import matplotlib.pyplot as plt
+    xf, pf, x0, zs, KF = problem5(False, seed)
     initial_x = xf[-1]
     preds = KF.predict(initial_x, 450)
+    px, py = _components(x0[:,:2])
+    qx, qy = _components(preds[:,:2])
     plt.subplot(121)
-    plt.plot(x0[:,0], x0[:,1], color="blue")
-    plt.plot(preds[:,0], preds[:,1], color="yellow", lw=1.25)
+    plt.plot(px, py, color="blue")
+    plt.plot(qx, qy, color="yellow", lw=1.25)
     plt.title("Actual vs. Prediction")
     plt.subplot(122)
-    plt.plot(x0[:,0], x0[:,1], color="blue")
-    plt.plot(preds[:,0], preds[:,1], color="yellow", lw=1.25)
+    plt.plot(px, py, color="blue")
+    plt.plot(qx, qy, color="yellow", lw=1.25)
     plt.xlim(35000, 36000)
     plt.ylim(0,100)
     plt.title("Zoomed In")
@@ -299,26 +719,28 @@ def problem7():
 #problem7()
 
 
-def problem9():
+def problem9(seed=0):
     """
     Using your state estimate xb250, predict the point of origin of the 
     projectile along with all states leading up to time step 250. 
     Plot these predicted states (in cyan) together with the original state 
     sequence. Repeat the prediction starting with xb600. 
     """
-    xf, pf, x0, zs, KF = problem5(False) 
-    initial_x = xf[50]
-    initial_x_2 = xf[400]
-    preds = KF.rewind(initial_x, 250)
-    preds2 = KF.rewind(initial_x_2, 600)
+    import matplotlib.pyplot as plt
+    xf, pf, x0, zs, KF = problem5(False, seed)
+    #Rewind both chains together, each only as far as time 0
+    preds, preds2 = KF.rewind_batch(np.stack([xf[50], xf[400]]), [250, 600])
+    px, py = _components(x0[:,:2])
+    qx, qy = _components(preds[:,:2])
+    qx2, qy2 = _components(preds2[:,:2])
     plt.subplot(121)
-    plt.plot(x0[:,0], x0[:,1], color="blue")
-    plt.plot(preds[:,0], preds[:,1], color="yellow", lw=1.25)
+    plt.plot(px, py, color="blue")
+    plt.plot(qx, qy, color="yellow", lw=1.25)
     plt.title("Starting at 250")
     
     plt.subplot(122)
-    plt.plot(x0[:,0], x0[:,1], color="blue")
-    plt.plot(preds2[:,0], preds2[:,1], color="yellow", lw=1.25)
+    plt.plot(px, py, color="blue")
+    plt.plot(qx2, qy2, color="yellow", lw=1.25)
     plt.title("Starting at 600")
     plt.show()
 #problem9()
\ No newline at end of file
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from my_kalman_filter1 import KalmanFilter, problem2
+
+
+def test_one_d_accepts_length_one_arrays():
+    a = lambda v: np.array([v])
+    KF = KalmanFilter(a(1.01), a(900.), a(1.08), a(300.), a(0.), one_d=True)
+    scalar_KF = KalmanFilter(1.01, 900., 1.08, 300., 0., one_d=True)
+
+    x, z = KF.evolve(a(1.), 50, seed=1)
+    scalar_x, scalar_z = scalar_KF.evolve(1., 50, seed=1)
+    assert np.array_equal(x, scalar_x) and np.array_equal(z, scalar_z)
+
+    out, P = KF.estimate(a(1.), a(10.), z[:, None])
+    scalar_out, scalar_P = scalar_KF.estimate(1., 10., z)
+    assert np.array_equal(out, scalar_out) and np.array_equal(P, scalar_P)
+
+
+def _problem2_run():
+    """problem2's filter with a fixed observation sequence and prior."""
+    KF = problem2()
+    rng = np.random.default_rng(3)
+    z = rng.normal(size=(300, 2))*70 + np.arange(300)[:, None]*30
+    return KF, np.array([0, 0, 300, 500.]), 1e6*KF.Q, z
+
+
+def _filter_like(KF, **kwargs):
+    return KalmanFilter(KF.F, KF.Q, KF.H, KF.R, KF.u, **kwargs)
+
+
+def test_update_paths_agree():
+    KF, x0, P0, z = _problem2_run()
+    ref_x, ref_P = KF.estimate(x0, P0, z, square_root=True)
+    for sequential in (True, False):
+        for selector in (True, False):
+            x, P = _filter_like(KF, h_is_selector=selector,
+                                sequential_update=sequential).estimate(x0, P0, z)
+            assert np.allclose(x, ref_x, rtol=0, atol=1e-8)
+            assert np.allclose(P, ref_P, rtol=1e-9, atol=1e-8)
+            assert np.array_equal(P, P.transpose(0, 2, 1))
+
+
+def test_jit_paths_agree():
+    pytest.importorskip("numba")
+    KF, x0, P0, z = _problem2_run()
+    ref_x, ref_P = KF.estimate(x0, P0, z)
+    for flags in ({}, dict(h_is_selector=False, sequential_update=False)):
+        x, P = _filter_like(KF, jit=True, **flags).estimate(x0, P0, z)
+        assert np.allclose(x, ref_x, rtol=0, atol=1e-8)
+        assert np.allclose(P, ref_P, rtol=1e-9, atol=1e-8)
+
+
+def test_flags_report_the_update_estimate_runs():
+    KF = problem2()
+    assert KF.h_is_selector and KF.sequential_update
+    #The 2x4 kernel does a joint update, so the jitted filter clears both
+    jitted = _filter_like(KF, jit=True)
+    assert not jitted.h_is_selector and not jitted.sequential_update
+    explicit = _filter_like(KF, jit=True, sequential_update=True)
+    assert explicit.h_is_selector and explicit.sequential_update